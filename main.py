@@ -1,39 +1,504 @@
+import hashlib
+import json
 import os
-from moviepy import VideoFileClip, concatenate_videoclips
+import re
+import shutil
+import subprocess
+import tempfile
+from fractions import Fraction
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+_ffmpeg_binary = None
+
+def get_ffmpeg():
+    """Resolve the ffmpeg binary once and share it through the environment"""
+    global _ffmpeg_binary
+    if _ffmpeg_binary is None:
+        # An explicit FFMPEG_BINARY (Docker, CI) skips the imageio lookup
+        _ffmpeg_binary = os.environ.get('FFMPEG_BINARY')
+        if not _ffmpeg_binary:
+            try:
+                # imageio-ffmpeg ships a static ffmpeg build, prefer it when installed
+                import imageio_ffmpeg
+                _ffmpeg_binary = imageio_ffmpeg.get_ffmpeg_exe()
+            except (ImportError, RuntimeError):
+                _ffmpeg_binary = "ffmpeg"
+        os.environ['FFMPEG_BINARY'] = _ffmpeg_binary
+    return _ffmpeg_binary
+
+FFMPEG_BINARY = get_ffmpeg()
+
+def find_ffprobe():
+    """Find ffprobe next to the ffmpeg binary, falling back to PATH"""
+    # Builds set through FFMPEG_BINARY usually ship both tools side by side;
+    # imageio-ffmpeg bundles no ffprobe, so that case ends up on PATH
+    ffmpeg_path = shutil.which(FFMPEG_BINARY)
+    if ffmpeg_path:
+        beside = shutil.which("ffprobe", path=os.path.dirname(ffmpeg_path))
+        if beside:
+            return beside
+    return shutil.which("ffprobe") or "ffprobe"
+
+FFPROBE_BINARY = find_ffprobe()
+
+# Folders, relative to where the script is run
+RECORDINGS_DIR = Path("recordings")
+INTRO_DIR = Path("introandoutro")
+OUTPUT_DIR = Path("output")
+# Intro/outro copies re-encoded to match a recording, reused across runs
+CACHE_DIR = INTRO_DIR / ".cache"
+
+# Trim times: MM:SS (minutes may exceed 59) or H:MM:SS (minutes up to 59)
+_TIME_RE = re.compile(r'^\s*(?:(\d+):([0-5]?\d)|(\d+)):([0-5]?\d)\s*$')
+
+# Output names are kept to a plain set of characters, which also rules out
+# path separators of any platform
+_SAFE_FILENAME = re.compile(r'^[A-Za-z0-9 _.-]{1,128}$')
+
+# Furthest a stream-copy cut may move the start back to reach a keyframe, in seconds
+MAX_KEYFRAME_SNAP = 5
+
+# Stream parameters that must be identical for a stream-copy join. The MP4
+# output keeps the first clip's codec setup (SPS/PPS), so profile, level,
+# reordering and the extradata itself have to match as well
+VIDEO_FIELDS = ('codec_name', 'width', 'height', 'pix_fmt', 'r_frame_rate', 'time_base',
+                'profile', 'level', 'has_b_frames', 'extradata_hash')
+AUDIO_FIELDS = ('codec_name', 'sample_rate', 'channels', 'profile', 'extradata_hash')
+
+# More cores can afford a slower x264 preset that writes smaller files.
+# ultrafast is never used: it drops CABAC and B-frames and roughly doubles
+# the output size. Thread count is left to x264, which scales on its own.
+CPU_COUNT = os.cpu_count() or 1
+X264_PRESET = 'faster' if CPU_COUNT >= 16 else 'veryfast'
+# x264 gives its lookahead a sixth of its (1.5x cores) threads, which is a
+# single thread below 8 cores and stalls the frame threads waiting on it
+X264_LOOKAHEAD_THREADS = max(2, CPU_COUNT * 3 // 2 // 6)
+
+# Encoder settings used when the clips have to be re-encoded, in order of
+# preference: hardware encoders first (NVIDIA, Apple, Intel, AMD), then x264
+ENCODER_ARGS = {
+    'h264_nvenc': ['-c:v', 'h264_nvenc', '-preset', 'p4', '-tune', 'hq',
+                   '-rc', 'vbr', '-cq', '23', '-b:v', '0'],
+    # Bitrate is added per export, see videotoolbox_bitrate()
+    'h264_videotoolbox': ['-c:v', 'h264_videotoolbox', '-allow_sw', '0'],
+    'h264_qsv': ['-c:v', 'h264_qsv', '-preset', 'veryfast', '-global_quality', '23'],
+    'h264_amf': ['-c:v', 'h264_amf', '-quality', 'balanced',
+                 '-rc', 'cqp', '-qp_i', '23', '-qp_p', '23'],
+    'libx264': ['-c:v', 'libx264', '-preset', X264_PRESET, '-crf', '23',
+                '-x264-params', f'lookahead-threads={X264_LOOKAHEAD_THREADS}'],
+}
+# Decode on the same hardware where ffmpeg can hand frames to the software
+# concat filter without extra options
+HWACCEL_ARGS = {
+    'h264_nvenc': ['-hwaccel', 'cuda'],
+    'h264_videotoolbox': ['-hwaccel', 'videotoolbox'],
+}
+# The concat filter can emit 4:4:4 frames, which many players cannot decode,
+# so frames are converted to 4:2:0 in the layout each encoder takes
+PIX_FMTS = {
+    'h264_qsv': 'nv12',
+}
+AUDIO_ARGS = ['-c:a', 'aac', '-b:a', '160k']
+# ffprobe profile names and the x264 profile that writes them
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+    'High 10': 'high10',
+    'High 4:2:2': 'high422',
+    'High 4:4:4 Predictive': 'high444',
+}
+
+_h264_encoder = None
+_listing_cache = {}
+
+def _scan_mp4(directory, predicate=lambda name: True):
+    """List the .mp4 files in a directory whose names pass `predicate`"""
+    # Adding, removing or renaming a file bumps the directory's mtime, so a
+    # rescan is only needed when it changed
+    key = (os.fspath(directory), os.stat(directory).st_mtime_ns, predicate)
+    if key not in _listing_cache:
+        with os.scandir(directory) as entries:
+            _listing_cache[key] = [e.name for e in entries
+                                   if e.name.endswith('.mp4') and e.is_file() and predicate(e.name)]
+    return list(_listing_cache[key])
+
+def _list_mp4(directory, predicate=lambda name: True):
+    """Like _scan_mp4, but report a missing directory and return no files"""
+    try:
+        return _scan_mp4(directory, predicate)
+    except (FileNotFoundError, NotADirectoryError):
+        print(f"Error: '{directory}' directory not found!")
+        return []
+
+def _is_intro(name):
+    return 'intro' in name.lower()
 
 def list_recordings():
     """List all available recordings"""
-    recordings_dir = "recordings"
-    if not os.path.exists(recordings_dir):
-        print(f"Error: '{recordings_dir}' directory not found!")
-        return []
-    
-    videos = [f for f in os.listdir(recordings_dir) if f.endswith('.mp4')]
-    return videos
+    return _list_mp4(RECORDINGS_DIR)
 
 def list_intros():
     """List all available intro videos"""
-    intro_dir = "introandoutro"
-    if not os.path.exists(intro_dir):
-        print(f"Error: '{intro_dir}' directory not found!")
-        return []
-    
-    intros = [f for f in os.listdir(intro_dir) if f.endswith('.mp4') and 'intro' in f.lower()]
-    return intros
+    return _list_mp4(INTRO_DIR, _is_intro)
 
 def parse_time(time_str):
-    """Convert MM:SS format to seconds"""
+    """Convert MM:SS or H:MM:SS format to seconds"""
+    match = _TIME_RE.match(time_str)
+    if match is None:
+        print("Invalid format. Please use MM:SS or H:MM:SS")
+        return None
+    hours, hour_minutes, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(hour_minutes or minutes) * 60 + int(seconds)
+
+def output_filename(name):
+    """Turn user input into a safe .mp4 filename, or None if it isn't safe"""
+    name = name.strip() or "final.mp4"
+    # Ensure .mp4 extension
+    if not name.lower().endswith('.mp4'):
+        name += ".mp4"
+    return name if _SAFE_FILENAME.match(name) else None
+
+def concat_line(path):
+    """Format a path as a line for the ffmpeg concat demuxer list"""
+    escaped = os.path.abspath(path).replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+def write_concat_list(list_path, intro_path, recording_path, outro_path, start_time, end_time):
+    """Write a concat demuxer list of intro, trimmed recording and outro"""
+    with open(list_path, 'w', encoding='utf-8') as f:
+        if intro_path:
+            f.write(concat_line(intro_path))
+        f.write(concat_line(recording_path))
+        # The demuxer trims the recording itself, no cut file needed
+        f.write(f"inpoint {start_time}\noutpoint {end_time}\n")
+        if outro_path:
+            f.write(concat_line(outro_path))
+
+def probe(path):
+    """Probe a clip's stream parameters and duration, or None if it can't be read"""
+    fields = dict.fromkeys(('codec_type',) + VIDEO_FIELDS + AUDIO_FIELDS)
+    # A missing ffprobe (OSError) is left to the caller, which reports it once
     try:
-        parts = time_str.split(':')
-        if len(parts) == 2:
-            minutes, seconds = map(int, parts)
-            return minutes * 60 + seconds
-        else:
-            print("Invalid format. Please use MM:SS")
-            return None
-    except ValueError:
-        print("Invalid time format. Please use numbers only.")
+        result = subprocess.run([
+            FFPROBE_BINARY, '-v', 'error', '-show_data_hash', 'sha256',
+            '-show_entries', 'stream=' + ','.join(fields) + ':format=duration',
+            '-of', 'json', path
+        ], capture_output=True, text=True, check=True)
+        info = json.loads(result.stdout)
+        duration = float(info.get('format', {}).get('duration', 0))
+    except (subprocess.CalledProcessError, ValueError):
         return None
+    
+    streams = info.get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video'), None)
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), None)
+    if video is None:
+        return None
+    # A clip without an audio track keeps None in place of its audio parameters
+    params = (tuple(video.get(field) for field in VIDEO_FIELDS),
+              tuple(audio.get(field) for field in AUDIO_FIELDS) if audio else None)
+    return params, duration
+
+def rough_probe(path):
+    """Stand-in for probe() read from ffmpeg's banner, for re-encoding without ffprobe"""
+    # Only the fields a re-encode needs are filled in, which is never enough
+    # to decide on a stream copy
+    try:
+        banner = subprocess.run([FFMPEG_BINARY, '-hide_banner', '-i', path],
+                                capture_output=True, text=True).stderr
+    except OSError:
+        return None
+    video_line = re.search(r'Stream #.*?: Video: (.*)', banner)
+    size = video_line and re.search(r', (\d+)x(\d+)', video_line[1])
+    if not size:
+        return None
+    video = dict.fromkeys(VIDEO_FIELDS)
+    video.update(width=int(size[1]), height=int(size[2]))
+    rate = re.search(r', ([\d.]+) (?:fps|tbr)', video_line[1])
+    if rate:
+        video['r_frame_rate'] = rate[1]
+    
+    audio = None
+    audio_line = re.search(r'Stream #.*?: Audio: (.*)', banner)
+    if audio_line:
+        audio = dict.fromkeys(AUDIO_FIELDS)
+        sample_rate = re.search(r'(\d+) Hz', audio_line[1])
+        audio.update(sample_rate=sample_rate[1] if sample_rate else '48000',
+                     channels=1 if ', mono' in audio_line[1] else 2)
+    
+    duration = re.search(r'Duration: (\d+):(\d+):([\d.]+)', banner)
+    seconds = (int(duration[1]) * 3600 + int(duration[2]) * 60 + float(duration[3])
+               if duration else 0)
+    params = (tuple(video.values()), tuple(audio.values()) if audio else None)
+    return params, seconds
+
+def probe_clips(paths):
+    """Probe several clips at once"""
+    # Each probe is mostly ffprobe start-up, so run them side by side
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        return list(executor.map(probe, paths))
+
+def streams_match(metas):
+    """Check whether probed clips can be joined without re-encoding"""
+    return None not in metas and len({params for params, _ in metas}) == 1
+
+def audio_matches(metas):
+    """Check whether probed clips share AAC audio that can be copied as-is"""
+    if None in metas:
+        return False
+    audio = {params[1] for params, _ in metas}
+    return len(audio) == 1 and None not in audio and next(iter(audio))[0] == 'aac'
+
+def silence_input(duration, audio=None):
+    """Input options for a silent track of `duration` seconds, shaped like `audio`"""
+    sample_rate, channels = (audio[1], audio[2]) if audio else (48000, 2)
+    layout = {1: 'mono', 2: 'stereo'}.get(channels, f"{channels}c")
+    return ['-f', 'lavfi', '-t', str(duration), '-i', f"anullsrc=r={sample_rate}:cl={layout}"]
+
+def snap_to_keyframe(path, time):
+    """Return the last keyframe at or before `time`, or None if it is too far back"""
+    try:
+        result = subprocess.run([
+            FFPROBE_BINARY, '-v', 'error',
+            '-select_streams', 'v:0', '-skip_frame', 'nokey',
+            '-show_entries', 'frame=pts_time', '-of', 'csv=p=0',
+            '-read_intervals', f"{max(0, time - MAX_KEYFRAME_SNAP)}%{time + 1}",
+            path
+        ], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    
+    keyframes = []
+    for line in result.stdout.split():
+        try:
+            keyframes.append(float(line.strip(',')))
+        except ValueError:
+            continue
+    # ffprobe seeks to the keyframe before the interval, so one is nearly
+    # always found; a long GOP must not pull in footage the user cut
+    earlier = [k for k in keyframes if time - MAX_KEYFRAME_SNAP <= k <= time]
+    return max(earlier) if earlier else None
+
+def fit_filter(width, height):
+    """Filter that scales a clip into a `width`x`height` frame, padding the rest"""
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+    )
+
+def videotoolbox_bitrate(video=None):
+    """Bitrate for VideoToolbox, scaled from 6 Mb/s at 1080p30 by pixel rate"""
+    # Constant quality (-q:v) is missing on Intel Macs, so a bitrate is used
+    full_hd = 1920 * 1080 * 30
+    try:
+        rate = video['width'] * video['height'] * Fraction(video['r_frame_rate'])
+    except (TypeError, ValueError, ZeroDivisionError):
+        rate = full_hd
+    return f"{max(2, round(6 * rate / full_hd))}M"
+
+def encoder_args(encoder, video=None):
+    """Output options for an encoder, as used by an export of `video`-sized frames"""
+    args = ENCODER_ARGS[encoder] + ['-pix_fmt', PIX_FMTS.get(encoder, 'yuv420p')]
+    if encoder == 'h264_videotoolbox':
+        args += ['-b:v', videotoolbox_bitrate(video)]
+    return args
+
+def encoder_works(encoder):
+    """Check that ffmpeg can run an encoder as an export does (listed is not enough for GPUs)"""
+    base = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y']
+    with tempfile.TemporaryDirectory(prefix="epe-") as temp_dir:
+        sample = os.path.join(temp_dir, "sample.mp4")
+        # Encode a short clip, then decode it the way an export does and send
+        # it through the concat filter into the encoder again
+        make_sample = base + [
+            '-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1'
+        ] + encoder_args(encoder) + [sample]
+        reencode = base + HWACCEL_ARGS.get(encoder, []) + [
+            '-i', sample,
+            '-filter_complex', '[0:v]concat=n=1:v=1:a=0[v]', '-map', '[v]'
+        ] + encoder_args(encoder) + ['-f', 'null', '-']
+        try:
+            return all(subprocess.run(cmd, capture_output=True).returncode == 0
+                       for cmd in (make_sample, reencode))
+        except OSError:
+            return False
+
+def pick_h264_encoder():
+    """Pick the fastest working H.264 encoder, probing ffmpeg only once"""
+    global _h264_encoder
+    if _h264_encoder is None:
+        try:
+            listing = subprocess.run([FFMPEG_BINARY, '-hide_banner', '-encoders'],
+                                     capture_output=True, text=True).stdout
+        except OSError:
+            listing = ''
+        _h264_encoder = next(
+            (encoder for encoder in ENCODER_ARGS
+             if encoder != 'libx264' and f" {encoder} " in listing and encoder_works(encoder)),
+            'libx264'
+        )
+    return _h264_encoder
+
+def build_reencode_cmd(intro_path, recording_path, outro_path, start_time, end_time,
+                       output_path, audio_list_path=None, metas=None):
+    """Build an ffmpeg command that trims and joins the clips with the concat filter"""
+    encoder = pick_h264_encoder()
+    hwaccel = HWACCEL_ARGS.get(encoder, [])
+    
+    cmd = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y']
+    if intro_path:
+        cmd += hwaccel + ['-i', intro_path]
+    cmd += hwaccel + ['-ss', str(start_time), '-t', str(end_time - start_time), '-i', recording_path]
+    if outro_path:
+        cmd += hwaccel + ['-i', outro_path]
+    
+    clips = [p for p in (intro_path, recording_path, outro_path) if p]
+    count = len(clips)
+    metas = metas or [None] * count
+    # The concat filter refuses segments of different sizes, so every clip is
+    # fitted to the recording's frame (or the first clip that could be probed).
+    # Frame rates are evened out too: ffmpeg 6 can stall for good on a concat
+    # of mixed rates
+    sized = next((meta for meta in [metas[clips.index(recording_path)], *metas] if meta), None)
+    if sized:
+        video = dict(zip(VIDEO_FIELDS, sized[0][0]))
+        fit = fit_filter(video['width'], video['height'])
+        if video['r_frame_rate'] not in (None, '0/0'):
+            fit += f",fps={video['r_frame_rate']}"
+        fitted = ''.join(f"[{i}:v]{fit}[v{i}];" for i in range(count))
+        video_streams = [f"[v{i}]" for i in range(count)]
+    else:
+        video = None
+        fitted = ''
+        video_streams = [f"[{i}:v]" for i in range(count)]
+    if audio_list_path:
+        # Audio is copied from a concat list of the same clips, so only the
+        # video goes through the filter
+        streams = ''.join(video_streams)
+        cmd += ['-f', 'concat', '-safe', '0', '-i', audio_list_path]
+        cmd += [
+            '-filter_complex', f"{fitted}{streams}concat=n={count}:v=1:a=0[v]",
+            '-map', '[v]', '-map', f"{count}:a"
+        ]
+        audio_args = ['-c:a', 'copy']
+    else:
+        # Clips without an audio track get a silent one, since every concat
+        # segment needs audio
+        audio = next((meta[0][1] for meta in metas if meta and meta[0][1]), None)
+        streams = ''
+        silent_input = count
+        for i, (path, meta) in enumerate(zip(clips, metas)):
+            if meta and meta[0][1] is None:
+                duration = min(end_time, meta[1]) - start_time if path == recording_path else meta[1]
+                cmd += silence_input(duration, audio)
+                streams += f"{video_streams[i]}[{silent_input}:a]"
+                silent_input += 1
+            else:
+                streams += f"{video_streams[i]}[{i}:a]"
+        cmd += [
+            '-filter_complex', f"{fitted}{streams}concat=n={count}:v=1:a=1[v][a]",
+            '-map', '[v]', '-map', '[a]'
+        ]
+        audio_args = AUDIO_ARGS
+    cmd += encoder_args(encoder, video)
+    cmd += audio_args + ['-movflags', '+faststart', output_path]
+    return cmd
+
+def start_ffmpeg(cmd):
+    """Start ffmpeg with machine-readable progress on its stdout"""
+    # bufsize only sizes our read buffer, so progress is pulled off the pipe
+    # in few large reads; the kernel pipe ffmpeg writes into is unchanged
+    return subprocess.Popen(
+        cmd[:1] + ['-progress', 'pipe:1', '-nostats'] + cmd[1:],
+        stdout=subprocess.PIPE, text=True, bufsize=1 << 20
+    )
+
+def show_progress(process, total_seconds):
+    """Draw a progress bar from ffmpeg's progress output until it exits"""
+    last = None
+    for line in process.stdout:
+        key, _, value = line.strip().partition('=')
+        # out_time_ms is in microseconds too, despite its name
+        if key not in ('out_time_us', 'out_time_ms') or not value.isdigit():
+            continue
+        done = int(value) / 1_000_000
+        if total_seconds:
+            percent = min(int(done * 100 / total_seconds), 100)
+            if percent != last:
+                filled = percent * 30 // 100
+                print(f"\r   [{'#' * filled}{'-' * (30 - filled)}] {percent:3d}%", end='', flush=True)
+                last = percent
+        else:
+            print(f"\r   {int(done) // 60:02d}:{int(done) % 60:02d} exported", end='', flush=True)
+    print()
+    return process.wait()
+
+def run_ffmpeg(cmd, total_seconds=None):
+    """Run an ffmpeg command, showing its progress"""
+    process = start_ffmpeg(cmd)
+    if show_progress(process, total_seconds):
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+def ensure_normalized(path, target, duration=None, silent=False):
+    """Return a cached copy of a clip re-encoded to the `target` stream parameters"""
+    video = dict(zip(VIDEO_FIELDS, target[0]))
+    audio = dict(zip(AUDIO_FIELDS, target[1]))
+    # Editing or replacing the source changes its mtime or size, and with it the key
+    stat = os.stat(path)
+    key = repr((os.path.abspath(path), stat.st_mtime_ns, stat.st_size, target, silent))
+    cache_path = CACHE_DIR / f"{Path(path).stem}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.mp4"
+    if cache_path.is_file():
+        return cache_path
+    
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    filters = (
+        f"{fit_filter(video['width'], video['height'])},"
+        f"fps={video['r_frame_rate']},format={video['pix_fmt']}"
+    )
+    # Follow the recording's codec setup as closely as x264 allows; the copy
+    # is only stream-copied if the probed parameters then match exactly
+    x264_args = []
+    if video['profile'] in X264_PROFILES:
+        x264_args += ['-profile:v', X264_PROFILES[video['profile']]]
+    if isinstance(video['level'], int) and video['level'] > 0:
+        x264_args += ['-level:v', f"{video['level'] / 10:.1f}"]
+    if video['has_b_frames'] == 0:
+        x264_args += ['-bf', '0']
+    # Write under a temporary name so an interrupted run never leaves a
+    # half-written file in the cache
+    part_path = cache_path.with_name(cache_path.name + ".part")
+    inputs = ['-i', path]
+    if silent:
+        # Give a clip without audio a silent track so it joins like the others
+        inputs += silence_input(duration, target[1]) + ['-map', '0:v', '-map', '1:a']
+    try:
+        run_ffmpeg([
+            FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y',
+            *inputs,
+            '-vf', filters,
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20', *x264_args,
+            '-video_track_timescale', video['time_base'].split('/')[-1],
+            '-c:a', 'aac', '-ar', str(audio['sample_rate']), '-ac', str(audio['channels']),
+            '-f', 'mp4', part_path
+        ], duration)
+        os.replace(part_path, cache_path)
+    finally:
+        part_path.unlink(missing_ok=True)
+    return cache_path
+
+def match_recording(path, meta, recording_meta):
+    """Swap an intro/outro for a copy that matches the recording, if needed"""
+    if path is None or (meta is not None and meta[0] == recording_meta[0]):
+        return path
+    try:
+        return ensure_normalized(path, recording_meta[0], meta[1] if meta else None,
+                                 silent=meta is not None and meta[0][1] is None)
+    except (OSError, subprocess.CalledProcessError):
+        # Leave the clip alone, the re-encode path can still join it
+        return path
 
 def main():
     print("=" * 50)
@@ -41,8 +506,15 @@ def main():
     print("=" * 50)
     
     # Create output directory if it doesn't exist
-    output_dir = "output"
-    os.makedirs(output_dir, exist_ok=True)
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    
+    # Look up intros and the outro in the background while the user picks a
+    # recording and types trim times, so slow storage never stalls a prompt
+    default_outro = INTRO_DIR / "mainoutro.mp4"
+    lookup = ThreadPoolExecutor(max_workers=2)
+    intros_future = lookup.submit(_scan_mp4, INTRO_DIR, _is_intro)
+    outro_future = lookup.submit(default_outro.is_file)
+    lookup.shutdown(wait=False)
     
     # Step 1: List and select recording
     recordings = list_recordings()
@@ -66,12 +538,12 @@ def main():
         except ValueError:
             print("Please enter a valid number.")
     
-    recording_path = os.path.join("recordings", selected_recording)
+    recording_path = RECORDINGS_DIR / selected_recording
     print(f"\nSelected: {selected_recording}")
     
     # Step 2: Get trim times
     print("\n" + "-" * 50)
-    print("Enter trim times (format: MM:SS)")
+    print("Enter trim times (format: MM:SS or H:MM:SS)")
     print("-" * 50)
     
     while True:
@@ -89,7 +561,11 @@ def main():
             print("End time must be after start time!")
     
     # Step 3: Select intro
-    intros = list_intros()
+    try:
+        intros = intros_future.result()
+    except OSError:
+        # Scan again in the foreground, which reports the problem
+        intros = list_intros()
     if not intros:
         print("\nWarning: No intro videos found!")
         intro_path = None
@@ -106,81 +582,125 @@ def main():
                 idx = int(choice) - 1
                 if 0 <= idx < len(intros):
                     selected_intro = intros[idx]
-                    intro_path = os.path.join("introandoutro", selected_intro)
+                    intro_path = INTRO_DIR / selected_intro
                     break
                 else:
                     print("Invalid selection. Please try again.")
             except ValueError:
                 print("Please enter a valid number.")
     
-    # Set outro path
-    outro_path = os.path.join("introandoutro", "mainoutro.mp4")
-    if not os.path.exists(outro_path):
-        print(f"\nWarning: '{outro_path}' not found!")
-        outro_path = None
+    # Set outro path, resolved with a single stat and carried from here on
+    outro_path = default_outro if outro_future.result() else None
+    if outro_path is None:
+        print(f"\nWarning: '{default_outro}' not found!")
+    
+    # Ask for output filename
+    while True:
+        user_filename = output_filename(input("Enter output filename (default: final.mp4): "))
+        if user_filename:
+            break
+        print("Invalid filename. Use only letters, numbers, spaces, '.', '_' and '-'.")
+    output_path = OUTPUT_DIR / user_filename
     
     # Step 4: Process video
     print("\n" + "=" * 50)
     print("Processing video... This may take a few minutes.")
     print("=" * 50)
     
+    # Intermediate files live in a scratch directory that is always removed
+    temp_dir = tempfile.mkdtemp(prefix="epe-")
+    list_path = os.path.join(temp_dir, "concat.txt")
+    
     try:
-        # Load and trim main recording
-        print("\n1. Loading and trimming main recording...")
-        main_clip = VideoFileClip(recording_path).subclipped(start_time, end_time)
-        
-        clips_to_concat = []
-        
-        # Add intro
-        if intro_path:
-            print("2. Adding intro...")
-            intro_clip = VideoFileClip(intro_path)
-            clips_to_concat.append(intro_clip)
-        
-        # Add main content
-        clips_to_concat.append(main_clip)
-        
-        # Add outro
-        if outro_path:
-            print("3. Adding outro...")
-            outro_clip = VideoFileClip(outro_path)
-            clips_to_concat.append(outro_clip)
-        
-        # Concatenate all clips
-        print("4. Combining all clips...")
-        final_clip = concatenate_videoclips(clips_to_concat)
-        
-        # Ask for output filename
-        while True:
-            user_filename = input("Enter output filename (default: final.mp4): ").strip()
-            if not user_filename:
-                user_filename = "final.mp4"
-            # Ensure .mp4 extension
-            if not user_filename.lower().endswith('.mp4'):
-                user_filename += ".mp4"
-            # Prevent path traversal by taking only the basename
-            user_filename = os.path.basename(user_filename)
-            if user_filename:
-                break
-            print("Invalid filename, try again.")
-        
-        # Export
-        output_path = os.path.join(output_dir, user_filename)
-        print(f"5. Exporting to {output_path}...")
-        final_clip.write_videofile(
-            output_path,
-            codec='libx264',
-            audio_codec='aac'
-        )
-        
-        # Clean up
-        print("6. Cleaning up...")
-        main_clip.close()
-        if intro_path:
-            intro_clip.close()
-        if outro_path:
-            outro_clip.close()
-        final_clip.close()
+        clips = [p for p in (intro_path, recording_path, outro_path) if p]
+        rough_metas = None
+        try:
+            metas = probe_clips(clips)
+            reason = "Clips use different settings"
+        except OSError:
+            # Without ffprobe nothing can be checked, so nothing can be copied.
+            # ffmpeg's banner still describes the clips well enough to re-encode
+            metas = [None] * len(clips)
+            rough_metas = [rough_probe(clip) for clip in clips]
+            reason = "ffprobe not found"
+        recording_meta = metas[clips.index(recording_path)]
+        # Only H.264/AAC recordings can be matched, since the copies are made with x264
+        if (not streams_match(metas) and recording_meta is not None
+                and recording_meta[0][0][0] == 'h264'
+                and recording_meta[0][1] is not None and recording_meta[0][1][0] == 'aac'):
+            # Re-encoding the short intro/outro once is far cheaper than
+            # re-encoding the whole recording on every run
+            print("\n   Intro/outro settings differ from the recording, matching them (cached)...")
+            meta_by_path = dict(zip(clips, metas))
+            intro_path = match_recording(intro_path, meta_by_path.get(intro_path), recording_meta)
+            outro_path = match_recording(outro_path, meta_by_path.get(outro_path), recording_meta)
+            clips = [p for p in (intro_path, recording_path, outro_path) if p]
+            metas = probe_clips(clips)
+            if not streams_match(metas):
+                reason = "Recording's encoder setup can't be matched exactly"
+        # Length of the intro and outro, used to scale the progress bar
+        extra_seconds = sum(meta[1] for path, meta in zip(clips, rough_metas or metas)
+                            if meta and path != recording_path)
+        copy_video = streams_match(metas)
+        copy_audio = audio_matches(metas)
+        cut_start = start_time
+        if copy_video or copy_audio:
+            # Anything copied as-is has to start the recording on a keyframe
+            print("\n   Finding trim points...")
+            keyframe = snap_to_keyframe(recording_path, start_time)
+            if keyframe is not None and not copy_video:
+                # The video is re-encoded anyway, so the cut is only moved for
+                # the audio's sake if it moves by less than one AAC frame
+                audio = dict(zip(AUDIO_FIELDS, metas[0][0][1]))
+                if start_time - keyframe > 1024 / int(audio['sample_rate']):
+                    keyframe = None
+            if keyframe is None:
+                # Copying from anywhere else would garble the start of the
+                # recording or put its audio out of sync, so encode everything
+                # and cut exactly where the user asked
+                if copy_video:
+                    reason = "No keyframe close to the start time"
+                copy_video = copy_audio = False
+            else:
+                cut_start = keyframe
+                if cut_start != start_time:
+                    print(f"   Start moved back to the nearest keyframe at {cut_start:.2f}s")
+        if copy_video:
+            # Build the concat list: intro, trimmed main, outro
+            print("\n1. Preparing intro and outro...")
+            write_concat_list(list_path, intro_path, recording_path, outro_path,
+                              cut_start, end_time)
+            
+            # Trim and join in a single pass by stream copy, no decoding or re-encoding
+            print(f"2. Exporting to {output_path}...")
+            run_ffmpeg([
+                FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y',
+                '-fflags', '+genpts',
+                '-f', 'concat', '-safe', '0',
+                '-i', list_path,
+                '-c', 'copy',
+                # A keyframe inpoint can leave audio slightly before zero
+                '-avoid_negative_ts', 'make_zero',
+                '-movflags', '+faststart',
+                output_path
+            ], extra_seconds + end_time - cut_start)
+        else:
+            # Clips differ in codec, size or frame rate, or the recording has no
+            # usable keyframe, so they must be re-encoded
+            print(f"\n1. {reason}, re-encoding with {pick_h264_encoder()}...")
+            audio_list_path = None
+            if copy_audio:
+                # Only the video differs, so the AAC audio is copied untouched.
+                # Video is cut at the same keyframe so the two stay in sync
+                print("   Audio matches and will be copied")
+                write_concat_list(list_path, intro_path, recording_path, outro_path,
+                                  cut_start, end_time)
+                audio_list_path = list_path
+            print(f"2. Exporting to {output_path}...")
+            run_ffmpeg(build_reencode_cmd(
+                intro_path, recording_path, outro_path,
+                cut_start, end_time, output_path, audio_list_path, rough_metas or metas
+            ), extra_seconds + end_time - cut_start)
         
         print("\n" + "=" * 50)
         print(f"SUCCESS! Video saved to: {output_path}")
@@ -189,6 +709,9 @@ def main():
     except Exception as e:
         print(f"\nError processing video: {e}")
         print("Make sure all video files exist and are valid MP4 files.")
+    finally:
+        # Clean up
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file